@@ -1,10 +1,11 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-import bcrypt
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
+import time
 
 SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
@@ -12,13 +13,20 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 security = HTTPBearer()
 
+@lru_cache(maxsize=1)
+def _bcrypt():
+    """Load the bcrypt native extension on first use, not at cold start"""
+    import bcrypt
+    return bcrypt
+
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
+    bcrypt = _bcrypt()
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return _bcrypt().checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
@@ -47,11 +55,26 @@ def decode_token(token: str) -> dict:
             detail="Could not validate credentials"
         )
 
+@lru_cache(maxsize=10000)
+def _verify_token_cached(token: str) -> tuple:
+    """Verify a token's signature once; repeat requests become dict lookups.
+
+    An SPA resends the same token for days, so re-running HMAC + base64
+    per request is wasted work. Failures raise and are never cached.
+    """
+    payload = decode_token(token)
+    return payload.get("sub"), payload.get("exp", 0)
+
 def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """Get current user ID from JWT token"""
     token = credentials.credentials
-    payload = decode_token(token)
-    user_id: str = payload.get("sub")
+    user_id, exp_ts = _verify_token_cached(token)
+    if exp_ts and exp_ts < time.time():
+        # The cached entry can outlive the token's validity window
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has expired"
+        )
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
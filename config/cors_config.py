@@ -4,36 +4,49 @@ Configurações de CORS para a aplicação MusicStream API
 import os
 from typing import List
 
+# Origens padrão para desenvolvimento
+_DEFAULT_ORIGINS = (
+    "http://localhost:3000",
+    "http://localhost:3001",
+    "http://localhost:5173",  # Vite
+    "http://localhost:4200",  # Angular
+    "https://localhost:3000",
+    "http://127.0.0.1:3000",
+    "http://127.0.0.1:5173",
+    "https://127.0.0.1:3000",
+    # Adicionar domínios de produção conhecidos
+    "https://music-project-front-3.vercel.app",
+    "https://music-project-backend.onrender.com",
+    "https://music-project-back-4.onrender.com",
+)
+
+# Calculado uma única vez no import — CORS_ORIGINS não muda durante o
+# processo, então cada chamada reconstruindo a lista era trabalho perdido
+_CORS_ORIGINS_ENV = os.getenv('CORS_ORIGINS', '*')
+ALLOW_ALL_ORIGINS = _CORS_ORIGINS_ENV == '*'
+ALLOWED_ORIGINS: frozenset = (
+    frozenset()
+    if ALLOW_ALL_ORIGINS
+    else frozenset(_DEFAULT_ORIGINS) | frozenset(
+        origin.strip() for origin in _CORS_ORIGINS_ENV.split(',')
+    )
+)
+
 def get_cors_origins() -> List[str]:
     """
     Retorna lista de origens permitidas para CORS
     """
-    # Origens padrão para desenvolvimento
-    default_origins = [
-        "http://localhost:3000",
-        "http://localhost:3001", 
-        "http://localhost:5173",  # Vite
-        "http://localhost:4200",  # Angular
-        "https://localhost:3000",
-        "http://127.0.0.1:3000",
-        "http://127.0.0.1:5173",
-        "https://127.0.0.1:3000",
-        # Adicionar domínios de produção conhecidos
-        "https://music-project-front-3.vercel.app",
-        "https://music-project-backend.onrender.com",
-        "https://music-project-back-4.onrender.com"
-    ]
-    
-    # Origens de produção do arquivo .env
-    env_origins = os.getenv('CORS_ORIGINS', '*')
-    
-    if env_origins == '*':
+    if ALLOW_ALL_ORIGINS:
         # Em desenvolvimento, permitir todas as origens
         return ["*"]
-    else:
-        # Em produção, usar origens específicas
-        prod_origins = [origin.strip() for origin in env_origins.split(',')]
-        return default_origins + prod_origins
+    # Em produção, usar origens específicas (lookup O(1) via ALLOWED_ORIGINS)
+    return list(ALLOWED_ORIGINS)
+
+def is_origin_allowed(origin: str) -> bool:
+    """
+    Verifica se uma origem é permitida — hash lookup, sem varredura linear
+    """
+    return ALLOW_ALL_ORIGINS or origin in ALLOWED_ORIGINS
 
 def get_cors_config() -> dict:
     """
@@ -67,5 +80,5 @@ def get_cors_config() -> dict:
             "Content-Range"
         ],
         "expose_headers": ["*"],
-        "max_age": 600
+        "max_age": int(os.getenv("CORS_MAX_AGE", "86400"))
     }
\ No newline at end of file
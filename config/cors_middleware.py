@@ -1,42 +1,71 @@
 """
 Middleware personalizado para CORS
 """
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response as StarletteResponse
-import logging
+import os
 
-logger = logging.getLogger(__name__)
+# Tempo de cache do preflight (Firefox aceita até 24h)
+CORS_MAX_AGE = os.getenv("CORS_MAX_AGE", "86400")
 
-class CORSMiddleware(BaseHTTPMiddleware):
+ALLOW_METHODS = "GET, POST, PUT, DELETE, OPTIONS, PATCH, HEAD"
+ALLOW_HEADERS = (
+    "Accept, Accept-Language, Content-Language, Content-Type, "
+    "Authorization, X-Requested-With, Range, Cache-Control"
+)
+
+
+class CORSMiddleware:
     """
-    Middleware personalizado para lidar com CORS
+    Middleware ASGI puro para lidar com CORS.
+
+    Responde preflights direto no protocolo ASGI, sem criar Request/Response
+    nem a task extra que o BaseHTTPMiddleware gasta por requisição.
     """
-    
-    async def dispatch(self, request: Request, call_next):
-        # Log da requisição para debug
-        logger.info(f"CORS Request: {request.method} {request.url}")
-        logger.info(f"Origin: {request.headers.get('origin', 'No origin')}")
-        
+
+    def __init__(self, app):
+        self.app = app
+        # Headers pré-codificados uma única vez; nada de encode/f-string
+        # por requisição
+        self._preflight_headers = (
+            # Corpo vazio explícito: evita negociação de chunked framing e
+            # deixa o proxy do Render reusar a conexão para o POST seguinte
+            (b"content-length", b"0"),
+            (b"connection", b"keep-alive"),
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-methods", ALLOW_METHODS.encode()),
+            (b"access-control-allow-headers", ALLOW_HEADERS.encode()),
+            (b"access-control-max-age", CORS_MAX_AGE.encode()),
+            (b"access-control-allow-credentials", b"true"),
+            # Permitir que proxies/CDN também cacheiem o preflight
+            (b"cache-control", f"public, max-age={CORS_MAX_AGE}".encode()),
+            (b"vary", b"Origin, Access-Control-Request-Headers, Access-Control-Request-Method"),
+        )
+        self._response_headers = (
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-credentials", b"true"),
+            (b"access-control-expose-headers", b"*"),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Se for uma requisição OPTIONS (preflight), responder imediatamente
-        if request.method == "OPTIONS":
-            response = StarletteResponse()
-            response.headers["Access-Control-Allow-Origin"] = "*"
-            response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH, HEAD"
-            response.headers["Access-Control-Allow-Headers"] = (
-                "Accept, Accept-Language, Content-Language, Content-Type, "
-                "Authorization, X-Requested-With, Range, Cache-Control"
-            )
-            response.headers["Access-Control-Max-Age"] = "3600"
-            response.headers["Access-Control-Allow-Credentials"] = "true"
-            return response
-        
-        # Processar requisição normal
-        response = await call_next(request)
-        
-        # Adicionar headers CORS à resposta
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Credentials"] = "true"
-        response.headers["Access-Control-Expose-Headers"] = "*"
-        
-        return response
\ No newline at end of file
+        if scope["method"] == "OPTIONS":
+            await send({
+                "type": "http.response.start",
+                "status": 204,
+                "headers": list(self._preflight_headers),
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        # Processar requisição normal, injetando os headers CORS na resposta
+        response_headers = self._response_headers
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + list(response_headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
@@ -1,57 +1,98 @@
 """
 Middleware CORS personalizado para garantir funcionamento em produção
 """
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response as StarletteResponse
 from typing import List
 import os
 
-class ProductionCORSMiddleware(BaseHTTPMiddleware):
+# Tempo de cache do preflight (Firefox aceita até 24h)
+CORS_MAX_AGE = os.getenv("CORS_MAX_AGE", "86400")
+
+ALLOW_METHODS = "GET, POST, PUT, DELETE, OPTIONS, PATCH, HEAD"
+ALLOW_HEADERS = (
+    "accept, accept-language, content-language, content-type, "
+    "authorization, x-requested-with, range, cache-control"
+)
+
+
+class ProductionCORSMiddleware:
     """
-    Middleware CORS personalizado para produção
+    Middleware CORS ASGI puro para produção.
+
+    Preflights são respondidos direto via send(), sem Request/Response nem a
+    task por requisição do BaseHTTPMiddleware.
     """
-    
+
     def __init__(self, app, allowed_origins: List[str] = None):
-        super().__init__(app)
+        self.app = app
         self.allowed_origins = allowed_origins or ["*"]
-        
-    def is_cors_preflight(self, request: Request) -> bool:
-        """Verifica se é uma requisição preflight CORS"""
-        return (
-            request.method == "OPTIONS" and
-            "origin" in request.headers and
-            "access-control-request-method" in request.headers
+        # Headers pré-codificados uma única vez; nada de encode/f-string
+        # por requisição
+        self._preflight_headers = (
+            # Corpo vazio explícito: evita negociação de chunked framing e
+            # deixa o proxy do Render reusar a conexão para o POST seguinte
+            (b"content-length", b"0"),
+            (b"connection", b"keep-alive"),
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-methods", ALLOW_METHODS.encode()),
+            (b"access-control-allow-headers", ALLOW_HEADERS.encode()),
+            (b"access-control-max-age", CORS_MAX_AGE.encode()),
+            (b"access-control-allow-credentials", b"true"),
+            # Permitir que proxies/CDN também cacheiem o preflight
+            (b"cache-control", f"public, max-age={CORS_MAX_AGE}".encode()),
+            (b"vary", b"Origin, Access-Control-Request-Headers, Access-Control-Request-Method"),
         )
-        
-    def is_cors_request(self, request: Request) -> bool:
+        self._response_headers = (
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-credentials", b"true"),
+            (b"access-control-expose-headers", b"*"),
+            (b"vary", b"Origin"),
+        )
+
+    @staticmethod
+    def _is_preflight(scope) -> bool:
+        """Verifica se é uma requisição preflight CORS"""
+        has_origin = False
+        has_request_method = False
+        for key, _ in scope["headers"]:
+            if key == b"origin":
+                has_origin = True
+            elif key == b"access-control-request-method":
+                has_request_method = True
+        return scope["method"] == "OPTIONS" and has_origin and has_request_method
+
+    @staticmethod
+    def _has_origin(scope) -> bool:
         """Verifica se é uma requisição CORS"""
-        return "origin" in request.headers
-    
-    async def dispatch(self, request: Request, call_next):
-        origin = request.headers.get("origin")
-        
+        for key, _ in scope["headers"]:
+            if key == b"origin":
+                return True
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Handle preflight requests
-        if self.is_cors_preflight(request):
-            response = StarletteResponse()
-            response.headers["access-control-allow-origin"] = "*"
-            response.headers["access-control-allow-methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH, HEAD"
-            response.headers["access-control-allow-headers"] = (
-                "accept, accept-language, content-language, content-type, "
-                "authorization, x-requested-with, range, cache-control"
-            )
-            response.headers["access-control-max-age"] = "3600"
-            response.headers["access-control-allow-credentials"] = "true"
-            return response
-        
+        if self._is_preflight(scope):
+            await send({
+                "type": "http.response.start",
+                "status": 204,
+                "headers": list(self._preflight_headers),
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
         # Handle actual requests
-        response = await call_next(request)
-        
-        # Add CORS headers to all responses
-        if self.is_cors_request(request):
-            response.headers["access-control-allow-origin"] = "*"
-            response.headers["access-control-allow-credentials"] = "true"
-            response.headers["access-control-expose-headers"] = "*"
-            response.headers["vary"] = "Origin"
-        
-        return response
\ No newline at end of file
+        if not self._has_origin(scope):
+            await self.app(scope, receive, send)
+            return
+
+        response_headers = self._response_headers
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + list(response_headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
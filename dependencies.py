@@ -0,0 +1,58 @@
+"""
+Shared FastAPI dependencies
+"""
+from fastapi import HTTPException, status
+import asyncio
+import time
+
+# Only re-ping MongoDB every few seconds — a per-request ping added a
+# full Atlas round-trip to every call for a check that almost always
+# succeeds
+_PING_TTL = 30.0
+_last_ping_ts = 0.0
+_ping_lock = asyncio.Lock()
+
+async def get_db():
+    """Get database connection with better error handling.
+
+    Resolves server.db lazily at request time instead of at route-module
+    import, so routers no longer force server.py to fully execute (and
+    no longer capture db while it is still None).
+    """
+    global _last_ping_ts
+    import server
+
+    if server.db is None or server.client is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={
+                "error": "Database service unavailable",
+                "message": "The database is currently not connected. Please check environment variables.",
+                "suggestions": [
+                    "Verify MONGO_URL environment variable is set",
+                    "Check MongoDB Atlas connectivity",
+                    "Contact system administrator"
+                ],
+                "cors_working": True
+            }
+        )
+
+    # Test the connection only when the last check went stale
+    now = time.monotonic()
+    if now - _last_ping_ts > _PING_TTL:
+        async with _ping_lock:
+            if time.monotonic() - _last_ping_ts > _PING_TTL:
+                try:
+                    await server._fast_ping(server.client)
+                    _last_ping_ts = time.monotonic()
+                except Exception as e:
+                    _last_ping_ts = 0.0
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail={
+                            "error": "Database connection failed",
+                            "message": f"Database ping failed: {str(e)}",
+                            "cors_working": True
+                        }
+                    )
+    return server.db
@@ -2,11 +2,40 @@ from fastapi import APIRouter, HTTPException, status, Depends, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import UserRegister, UserLogin, UserResponse, UserInDB, TokenResponse
 from auth import hash_password, verify_password, create_access_token, get_current_user_id
+from dependencies import get_db
+from utils.database_utils import get_collection
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
+import asyncio
+import time
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# Short-lived in-process cache of user documents so chatty clients
+# (/auth/me + /favorite back to back) don't hit Atlas repeatedly
+_USER_CACHE_TTL = 30.0
+_USER_CACHE_MAX = 10000
+_user_cache: dict = {}
+
+async def fetch_user(db, user_id: str):
+    """Fetch a user document, cached per process for a few seconds"""
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    db_user = await db.users.find_one({"_id": ObjectId(user_id)})
+    if db_user is not None:
+        if len(_user_cache) >= _USER_CACHE_MAX:
+            _user_cache.clear()
+        _user_cache[user_id] = (db_user, now + _USER_CACHE_TTL)
+    return db_user
+
+def invalidate_user_cache(user_id: str):
+    """Drop a cached user after a write (e.g. favorites toggle)"""
+    _user_cache.pop(user_id, None)
+
 # Test endpoint that doesn't require database
 @router.get("/test")
 async def test_auth_endpoint():
@@ -19,64 +48,35 @@ async def test_auth_endpoint():
         "timestamp": datetime.utcnow()
     }
 
-# Database dependency - import from server
-async def get_database():
-    """Get database connection with better error handling"""
-    from server import db, client
-    
-    if db is None or client is None:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail={
-                "error": "Database service unavailable",
-                "message": "The database is currently not connected. Please check environment variables.",
-                "suggestions": [
-                    "Verify MONGO_URL environment variable is set",
-                    "Check MongoDB Atlas connectivity", 
-                    "Contact system administrator"
-                ],
-                "cors_working": True
-            }
-        )
-    
-    # Test if connection is actually working
-    try:
-        await client.admin.command('ping')
-        return db
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail={
-                "error": "Database connection failed",
-                "message": f"Database ping failed: {str(e)}",
-                "cors_working": True
-            }
-        )
-
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
-async def register(user: UserRegister, response: Response):
+async def register(
+    user: UserRegister,
+    response: Response,
+    db = Depends(get_db)
+):
     # Add CORS headers manually
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Credentials"] = "true"
     
-    # Get database connection with error handling
-    db = await get_database()
-    
-    # Check if user already exists
-    existing_user = await db.users.find_one({"email": user.email})
-    if existing_user:
+    # Create new user — the unique index on users.email enforces the
+    # "already registered" check atomically, saving a pre-check read
+    user_dict = user.dict()
+    # bcrypt takes 50-300ms; run it off the event loop so other requests
+    # keep being served meanwhile
+    user_dict['password'] = await asyncio.to_thread(hash_password, user_dict['password'])
+    user_dict['favoriteIds'] = []
+    user_dict['createdAt'] = datetime.utcnow()
+
+    try:
+        # First write ensures the collection's indexes (incl. the unique
+        # email index the DuplicateKeyError below depends on)
+        users = await get_collection(db, "users")
+        result = await users.insert_one(user_dict)
+    except DuplicateKeyError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
-    
-    # Create new user
-    user_dict = user.dict()
-    user_dict['password'] = hash_password(user_dict['password'])
-    user_dict['favoriteIds'] = []
-    user_dict['createdAt'] = datetime.utcnow()
-    
-    result = await db.users.insert_one(user_dict)
     user_id = str(result.inserted_id)
     
     # Create access token
@@ -98,14 +98,15 @@ async def register(user: UserRegister, response: Response):
     )
 
 @router.post("/login", response_model=TokenResponse)
-async def login(user: UserLogin, response: Response):
+async def login(
+    user: UserLogin,
+    response: Response,
+    db = Depends(get_db)
+):
     # Add CORS headers manually
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Credentials"] = "true"
     
-    # Get database connection with error handling
-    db = await get_database()
-    
     # Find user
     db_user = await db.users.find_one({"email": user.email})
     if not db_user:
@@ -114,8 +115,8 @@ async def login(user: UserLogin, response: Response):
             detail="Invalid credentials"
         )
     
-    # Verify password
-    if not verify_password(user.password, db_user['password']):
+    # Verify password off the event loop (bcrypt is deliberately slow)
+    if not await asyncio.to_thread(verify_password, user.password, db_user['password']):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
@@ -141,11 +142,11 @@ async def login(user: UserLogin, response: Response):
     )
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user(user_id: str = Depends(get_current_user_id)):
-    # Get database connection with error handling
-    db = await get_database()
-    
-    db_user = await db.users.find_one({"_id": ObjectId(user_id)})
+async def get_current_user(
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
+):
+    db_user = await fetch_user(db, user_id)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
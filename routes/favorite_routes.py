@@ -2,56 +2,76 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import MusicResponse
 from auth import get_current_user_id
+from dependencies import get_db
+from routes.auth_routes import invalidate_user_cache
 from bson import ObjectId
+from pymongo import ReturnDocument
 from typing import List
 
 router = APIRouter(prefix="/favorite", tags=["favorite"])
 
-from server import db
+# Only the fields MusicResponse serializes — skips decoding anything else
+_MUSIC_PROJECTION = {
+    "title": 1, "artist": 1, "genre": 1, "duration": 1,
+    "coverUrl": 1, "audioUrl": 1, "uploadedBy": 1, "createdAt": 1
+}
 
 @router.post("/{music_id}", status_code=status.HTTP_200_OK)
 async def toggle_favorite(
     music_id: str,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
 ):
-    # Check if music exists
-    music = await db.musics.find_one({"_id": ObjectId(music_id)})
+    # Check if music exists (projection-only, we just need existence)
+    music = await db.musics.find_one({"_id": ObjectId(music_id)}, {"_id": 1})
     if not music:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Music not found"
         )
-    
-    # Get user
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    favorite_ids = user.get('favoriteIds', [])
-    
-    # Toggle favorite
-    if music_id in favorite_ids:
-        await db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$pull": {"favoriteIds": music_id}}
-        )
-        return {"message": "Removed from favorites", "isFavorite": False}
-    else:
-        await db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$push": {"favoriteIds": music_id}}
-        )
+
+    # Toggle favorite atomically server-side: remove the id if present,
+    # append it otherwise — one round-trip instead of find_one + update_one
+    user = await db.users.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        [{
+            "$set": {
+                "favoriteIds": {
+                    "$cond": [
+                        {"$in": [music_id, {"$ifNull": ["$favoriteIds", []]}]},
+                        {"$setDifference": ["$favoriteIds", [music_id]]},
+                        {"$concatArrays": [{"$ifNull": ["$favoriteIds", []]}, [music_id]]}
+                    ]
+                }
+            }
+        }],
+        return_document=ReturnDocument.AFTER,
+        projection={"favoriteIds": 1}
+    )
+    invalidate_user_cache(user_id)
+
+    if music_id in user.get('favoriteIds', []):
         return {"message": "Added to favorites", "isFavorite": True}
+    else:
+        return {"message": "Removed from favorites", "isFavorite": False}
 
 @router.get("", response_model=List[MusicResponse])
-async def get_favorites(user_id: str = Depends(get_current_user_id)):
+async def get_favorites(
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
+):
     user = await db.users.find_one({"_id": ObjectId(user_id)})
     favorite_ids = user.get('favoriteIds', [])
     
     if not favorite_ids:
         return []
     
-    # Get all favorite musics
+    # Get all favorite musics, fetching only the fields we serialize and
+    # sizing the batch to the actual favorites count
     musics = await db.musics.find(
-        {"_id": {"$in": [ObjectId(fid) for fid in favorite_ids]}}
-    ).to_list(1000)
+        {"_id": {"$in": list(map(ObjectId, favorite_ids))}},
+        _MUSIC_PROJECTION
+    ).to_list(length=len(favorite_ids))
     
     return [
         MusicResponse(
@@ -1,21 +1,34 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Depends, UploadFile, File, Form, Query, Request
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import MusicResponse, MusicInDB
+from models import MusicResponse, MusicInDB, PyObjectId
 from auth import get_current_user_id
+from utils.database_utils import get_collection
 from bson import ObjectId
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Optional
+import aiofiles
+import aiofiles.os
+import asyncio
 import os
-import shutil
+import time
 from pathlib import Path
 import mimetypes
+import secrets
 
 router = APIRouter(prefix="/music", tags=["music"])
 
+@lru_cache(maxsize=1)
+def _server_module():
+    # Cache the module lookup; server.db itself stays a live attribute so
+    # reconnects are still picked up
+    import server
+    return server
+
 # Database dependency - import from server
 def get_database():
-    from server import db
+    db = _server_module().db
     if db is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -23,6 +36,36 @@ def get_database():
         )
     return db
 
+# Only the fields MusicResponse serializes — skips decoding anything else
+_MUSIC_PROJECTION = {
+    "title": 1, "artist": 1, "genre": 1, "duration": 1,
+    "coverUrl": 1, "audioUrl": 1, "uploadedBy": 1, "createdAt": 1
+}
+
+# Music documents are immutable after upload, so the "currently playing"
+# track (the hottest lookup in the app) caches extremely well
+_MUSIC_CACHE_TTL = 300.0
+_MUSIC_CACHE_MAX = 4096
+_music_cache: dict = {}
+
+async def _get_music_doc(db, music_id: str):
+    """Fetch a music document, cached per process for a few minutes"""
+    now = time.monotonic()
+    cached = _music_cache.get(music_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    music = await db.musics.find_one({"_id": ObjectId(music_id)}, _MUSIC_PROJECTION)
+    if music is not None:
+        if len(_music_cache) >= _MUSIC_CACHE_MAX:
+            _music_cache.clear()
+        _music_cache[music_id] = (music, now + _MUSIC_CACHE_TTL)
+    return music
+
+def _invalidate_music_cache(music_id: str):
+    """Drop a cached music document after delete"""
+    _music_cache.pop(music_id, None)
+
 # Use relative paths for Render compatibility
 UPLOAD_DIR = Path("uploads/music")
 COVER_DIR = Path("uploads/covers")
@@ -40,32 +83,86 @@ except PermissionError:
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     COVER_DIR.mkdir(parents=True, exist_ok=True)
 
+async def _probe_and_update_duration(file_path: Path, music_id: str):
+    """Read the real duration from the audio headers and store it.
+
+    Runs as a background task after the upload response is sent; the
+    mutagen parse happens in a thread so the event loop stays free.
+    """
+    try:
+        from mutagen import File as MutagenFile
+        audio_info = await asyncio.to_thread(MutagenFile, file_path)
+        seconds = getattr(getattr(audio_info, 'info', None), 'length', None)
+        if seconds:
+            db = get_database()
+            await db.musics.update_one(
+                {"_id": ObjectId(music_id)},
+                {"$set": {"duration": int(seconds)}}
+            )
+            _invalidate_music_cache(music_id)
+    except Exception as e:
+        # Keep the client-provided (or zero) duration if probing fails
+        print(f"Failed to probe duration: {str(e)}")
+
+# Magic bytes of the audio containers the player actually handles —
+# client-sent Content-Type is free-form and can't be trusted
+_AUDIO_SIGNATURES = (
+    b"ID3",          # MP3 with ID3v2 tag
+    b"\xff\xfb", b"\xff\xf3", b"\xff\xf2",  # bare MPEG frame sync
+    b"OggS",         # Ogg Vorbis/Opus
+    b"fLaC",         # FLAC
+)
+
+def _looks_like_audio(header: bytes) -> bool:
+    """Sniff real audio content from the first bytes of the upload"""
+    if header.startswith(_AUDIO_SIGNATURES):
+        return True
+    # WAV: RIFF....WAVE / M4A-AAC: ....ftyp
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return True
+    if header[4:8] == b"ftyp":
+        return True
+    return False
+
+async def _save_upload(upload: UploadFile, dest: Path, chunk_size: int = 1 << 20):
+    """Stream an UploadFile to disk in async chunks without blocking the loop"""
+    async with aiofiles.open(dest, "wb") as buffer:
+        while chunk := await upload.read(chunk_size):
+            await buffer.write(chunk)
+
 @router.post("/upload", response_model=MusicResponse, status_code=status.HTTP_201_CREATED)
 async def upload_music(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     artist: str = Form(...),
     genre: str = Form(...),
-    duration: int = Form(...),
+    # Optional now — when omitted the server probes the real duration
+    # from the audio headers instead of trusting the client
+    duration: Optional[int] = Form(None),
     audio: UploadFile = File(...),
     cover: Optional[UploadFile] = File(None),
     user_id: str = Depends(get_current_user_id)
 ):
-    # Validate audio file
-    if not audio.content_type or not audio.content_type.startswith('audio/'):
+    # Validate audio by sniffing the file header instead of trusting the
+    # client Content-Type, and reject before saving the multi-MB body
+    header = await audio.read(262)
+    await audio.seek(0)
+    if not _looks_like_audio(header):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="File must be an audio file"
         )
     
-    # Generate unique filename for audio
+    # Generate unique filename for audio — a random token avoids the
+    # ObjectId counter lock and keeps user input out of the path
     file_extension = os.path.splitext(audio.filename)[1]
-    unique_filename = f"{ObjectId()}_{title.replace(' ', '_')}{file_extension}"
+    unique_filename = f"{secrets.token_urlsafe(16)}{file_extension}"
     file_path = UPLOAD_DIR / unique_filename
     
-    # Save audio file
+    # Save audio file in async chunks so multi-MB uploads don't block the
+    # event loop for their whole duration
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
+        await _save_upload(audio, file_path)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -84,13 +181,12 @@ async def upload_music(
         
         # Generate unique filename for cover
         cover_extension = os.path.splitext(cover.filename)[1]
-        unique_cover_filename = f"{ObjectId()}_{title.replace(' ', '_')}{cover_extension}"
+        unique_cover_filename = f"{secrets.token_urlsafe(16)}{cover_extension}"
         cover_path = COVER_DIR / unique_cover_filename
         
         # Save cover file
         try:
-            with open(cover_path, "wb") as buffer:
-                shutil.copyfileobj(cover.file, buffer)
+            await _save_upload(cover, cover_path)
             cover_url = f"/api/music/cover/{unique_cover_filename}"
         except Exception as e:
             # Don't fail upload if cover fails, just use default
@@ -101,50 +197,108 @@ async def upload_music(
         "title": title,
         "artist": artist,
         "genre": genre,
-        "duration": duration,
+        "duration": duration if duration is not None else 0,
         "coverUrl": cover_url,
         "audioUrl": f"/api/music/stream/{unique_filename}",
         "uploadedBy": user_id,
         "createdAt": datetime.utcnow()
     }
     
-    # Get database connection
+    # Get database connection; first write ensures the musics indexes
     db = get_database()
-    result = await db.musics.insert_one(music_dict)
+    musics = await get_collection(db, "musics")
+    result = await musics.insert_one(music_dict)
     music_id = str(result.inserted_id)
-    
+
+    # Probe the real duration after the response is sent
+    background_tasks.add_task(_probe_and_update_duration, file_path, music_id)
+
     return MusicResponse(
         id=music_id,
         title=title,
         artist=artist,
         genre=genre,
-        duration=duration,
+        duration=music_dict['duration'],
         coverUrl=music_dict['coverUrl'],
         audioUrl=music_dict['audioUrl'],
         uploadedBy=user_id,
         createdAt=music_dict['createdAt']
     )
 
+_STREAM_CHUNK = 64 * 1024
+
+async def _iter_file(file_path: Path, start: int, length: int):
+    """Yield a byte range of a file in async 64KB chunks"""
+    remaining = length
+    async with aiofiles.open(file_path, "rb") as f:
+        await f.seek(start)
+        while remaining > 0:
+            chunk = await f.read(min(_STREAM_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
 @router.get("/stream/{filename}")
-async def stream_music(filename: str):
+async def stream_music(filename: str, request: Request):
     file_path = UPLOAD_DIR / filename
     if not file_path.exists():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Audio file not found"
         )
-    
-    return FileResponse(
-        path=file_path,
+
+    file_size = file_path.stat().st_size
+    headers = {
+        "Accept-Ranges": "bytes",
+        # no-transform: audio is already compressed, keep proxies from
+        # recoding it (our own gzip middleware skips this route)
+        "Cache-Control": "public, max-age=3600, no-transform",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, OPTIONS",
+        "Access-Control-Allow-Headers": "Range, Content-Range"
+    }
+
+    # Honor Range requests so player seeks only transfer the requested
+    # window instead of the whole file
+    range_header = request.headers.get("range")
+    if range_header and range_header.startswith("bytes="):
+        range_spec = range_header[len("bytes="):].split(",")[0].strip()
+        range_start, _, range_end = range_spec.partition("-")
+        try:
+            if range_start:
+                start = int(range_start)
+                end = int(range_end) if range_end else file_size - 1
+            elif range_end:
+                # Suffix form (bytes=-N): the last N bytes of the file,
+                # used by players to grab trailing metadata (ID3v1, moov)
+                start = max(file_size - int(range_end), 0)
+                end = file_size - 1
+            else:
+                start, end = 0, file_size - 1
+        except ValueError:
+            start, end = 0, file_size - 1
+        if start >= file_size:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="Requested range not satisfiable"
+            )
+        end = min(end, file_size - 1)
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(
+            _iter_file(file_path, start, length),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type="audio/mpeg",
+            headers=headers
+        )
+
+    headers["Content-Length"] = str(file_size)
+    return StreamingResponse(
+        _iter_file(file_path, 0, file_size),
         media_type="audio/mpeg",
-        filename=filename,
-        headers={
-            "Accept-Ranges": "bytes",
-            "Cache-Control": "public, max-age=3600",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Access-Control-Allow-Headers": "Range, Content-Range"
-        }
+        headers=headers
     )
 
 @router.get("/cover/{filename}")
@@ -170,26 +324,27 @@ async def get_cover(filename: str):
     )
 
 @router.get("", response_model=List[MusicResponse])
-async def get_all_musics():
-    musics = await db.musics.find().to_list(1000)
-    return [
-        MusicResponse(
-            id=str(music['_id']),
-            title=music['title'],
-            artist=music['artist'],
-            genre=music['genre'],
-            duration=music['duration'],
-            coverUrl=music['coverUrl'],
-            audioUrl=music['audioUrl'],
-            uploadedBy=music['uploadedBy'],
-            createdAt=music['createdAt']
-        )
-        for music in musics
-    ]
+async def get_all_musics(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200)
+):
+    # Paginated, newest first, with a projection — the old unbounded
+    # to_list(1000) serialized the whole catalog on every call
+    db = get_database()
+    cursor = db.musics.find({}, _MUSIC_PROJECTION).sort("createdAt", -1).skip(skip).limit(limit)
+    musics = []
+    async for music in cursor:
+        # Documents already match MusicResponse; returning a response
+        # directly skips the Pydantic validate/serialize roundtrip and
+        # lets orjson handle datetimes natively
+        music['id'] = str(music.pop('_id'))
+        musics.append(music)
+    return ORJSONResponse(content=musics)
 
 @router.get("/{music_id}", response_model=MusicResponse)
-async def get_music(music_id: str):
-    music = await db.musics.find_one({"_id": ObjectId(music_id)})
+async def get_music(music_id: PyObjectId):
+    db = get_database()
+    music = await _get_music_doc(db, music_id)
     if not music:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -210,30 +365,27 @@ async def get_music(music_id: str):
 
 @router.delete("/{music_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_music(
-    music_id: str,
+    music_id: PyObjectId,
     user_id: str = Depends(get_current_user_id)
 ):
-    music = await db.musics.find_one({"_id": ObjectId(music_id)})
+    db = get_database()
+    # Ownership in the filter makes fetch+check+delete one atomic
+    # round-trip; non-owners get the same 404 as a missing document
+    music = await db.musics.find_one_and_delete(
+        {"_id": ObjectId(music_id), "uploadedBy": user_id},
+        projection={"audioUrl": 1}
+    )
     if not music:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Music not found"
         )
-    
-    # Check if user is the uploader
-    if music['uploadedBy'] != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to delete this music"
-        )
-    
-    # Delete file
+
+    # Unlink in a thread so a slow disk can't block the event loop
     filename = music['audioUrl'].split('/')[-1]
     file_path = UPLOAD_DIR / filename
     if file_path.exists():
-        os.remove(file_path)
-    
-    # Delete from database
-    await db.musics.delete_one({"_id": ObjectId(music_id)})
-    
+        await aiofiles.os.remove(file_path)
+    _invalidate_music_cache(music_id)
+
     return None
\ No newline at end of file
@@ -1,19 +1,28 @@
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.responses import ORJSONResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import PlaylistCreate, PlaylistUpdate, PlaylistResponse, AddMusicToPlaylist
 from auth import get_current_user_id
+from dependencies import get_db
+from utils.database_utils import get_collection
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
 from typing import List
+import asyncio
 
 router = APIRouter(prefix="/playlist", tags=["playlist"])
 
-from server import db
+# Only the fields PlaylistResponse serializes
+_PLAYLIST_PROJECTION = {
+    "name": 1, "description": 1, "userId": 1, "musicIds": 1, "createdAt": 1
+}
 
 @router.post("", response_model=PlaylistResponse, status_code=status.HTTP_201_CREATED)
 async def create_playlist(
     playlist: PlaylistCreate,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
 ):
     playlist_dict = {
         "name": playlist.name,
@@ -23,7 +32,9 @@ async def create_playlist(
         "createdAt": datetime.utcnow()
     }
     
-    result = await db.playlists.insert_one(playlist_dict)
+    # First write ensures the playlists indexes
+    playlists = await get_collection(db, "playlists")
+    result = await playlists.insert_one(playlist_dict)
     playlist_id = str(result.inserted_id)
     
     return PlaylistResponse(
@@ -36,38 +47,44 @@ async def create_playlist(
     )
 
 @router.get("", response_model=List[PlaylistResponse])
-async def get_user_playlists(user_id: str = Depends(get_current_user_id)):
-    playlists = await db.playlists.find({"userId": user_id}).to_list(1000)
-    return [
-        PlaylistResponse(
-            id=str(playlist['_id']),
-            name=playlist['name'],
-            description=playlist.get('description', ''),
-            userId=playlist['userId'],
-            musicIds=playlist.get('musicIds', []),
-            createdAt=playlist['createdAt']
-        )
+async def get_user_playlists(
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
+):
+    playlists = await db.playlists.find({"userId": user_id}, _PLAYLIST_PROJECTION).to_list(1000)
+    # Documents already mirror PlaylistResponse; serializing the dicts
+    # straight through orjson skips the Pydantic roundtrip
+    return ORJSONResponse(content=[
+        {
+            "id": str(playlist['_id']),
+            "name": playlist['name'],
+            "description": playlist.get('description', ''),
+            "userId": playlist['userId'],
+            "musicIds": playlist.get('musicIds', []),
+            "createdAt": playlist['createdAt']
+        }
         for playlist in playlists
-    ]
+    ])
 
 @router.get("/{playlist_id}", response_model=PlaylistResponse)
 async def get_playlist(
     playlist_id: str,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
 ):
-    playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)})
+    playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)}, _PLAYLIST_PROJECTION)
     if not playlist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Playlist not found"
         )
-    
+
     if playlist['userId'] != user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this playlist"
         )
-    
+
     return PlaylistResponse(
         id=str(playlist['_id']),
         name=playlist['name'],
@@ -81,29 +98,29 @@ async def get_playlist(
 async def update_playlist(
     playlist_id: str,
     playlist: PlaylistUpdate,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
 ):
-    db_playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)})
-    if not db_playlist:
+    # Ownership lives in the filter and the update returns the new
+    # document: one round-trip instead of find_one + update_one + find_one
+    update_data = {k: v for k, v in playlist.dict().items() if v is not None}
+    if update_data:
+        updated_playlist = await db.playlists.find_one_and_update(
+            {"_id": ObjectId(playlist_id), "userId": user_id},
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER,
+            projection=_PLAYLIST_PROJECTION
+        )
+    else:
+        updated_playlist = await db.playlists.find_one(
+            {"_id": ObjectId(playlist_id), "userId": user_id},
+            _PLAYLIST_PROJECTION
+        )
+    if not updated_playlist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Playlist not found"
         )
-    
-    if db_playlist['userId'] != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update this playlist"
-        )
-    
-    update_data = {k: v for k, v in playlist.dict().items() if v is not None}
-    if update_data:
-        await db.playlists.update_one(
-            {"_id": ObjectId(playlist_id)},
-            {"$set": update_data}
-        )
-    
-    updated_playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)})
     return PlaylistResponse(
         id=str(updated_playlist['_id']),
         name=updated_playlist['name'],
@@ -116,59 +133,59 @@ async def update_playlist(
 @router.delete("/{playlist_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_playlist(
     playlist_id: str,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
 ):
-    playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)})
+    # Ownership in the filter: one atomic round-trip, and unauthorized
+    # deletes are indistinguishable from missing playlists
+    playlist = await db.playlists.find_one_and_delete(
+        {"_id": ObjectId(playlist_id), "userId": user_id},
+        projection={"_id": 1}
+    )
     if not playlist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Playlist not found"
         )
-    
-    if playlist['userId'] != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to delete this playlist"
-        )
-    
-    await db.playlists.delete_one({"_id": ObjectId(playlist_id)})
     return None
 
 @router.post("/{playlist_id}/add", response_model=PlaylistResponse)
 async def add_music_to_playlist(
     playlist_id: str,
     music_data: AddMusicToPlaylist,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
 ):
-    playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)})
-    if not playlist:
+    # The two existence checks are independent reads, so their
+    # round-trips overlap; the $addToSet only runs after both pass, so
+    # an error path never mutates the playlist
+    playlist, music = await asyncio.gather(
+        db.playlists.find_one({"_id": ObjectId(playlist_id), "userId": user_id}, {"_id": 1}),
+        db.musics.find_one({"_id": ObjectId(music_data.musicId)}, {"_id": 1})
+    )
+    if not music:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Playlist not found"
+            detail="Music not found"
         )
-    
-    if playlist['userId'] != user_id:
+    if not playlist:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to modify this playlist"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Playlist not found"
         )
-    
-    # Check if music exists
-    music = await db.musics.find_one({"_id": ObjectId(music_data.musicId)})
-    if not music:
+
+    updated_playlist = await db.playlists.find_one_and_update(
+        {"_id": ObjectId(playlist_id), "userId": user_id},
+        {"$addToSet": {"musicIds": music_data.musicId}},
+        return_document=ReturnDocument.AFTER,
+        projection=_PLAYLIST_PROJECTION
+    )
+    if not updated_playlist:
+        # Deleted between the check and the update
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Music not found"
-        )
-    
-    # Add music if not already in playlist
-    if music_data.musicId not in playlist.get('musicIds', []):
-        await db.playlists.update_one(
-            {"_id": ObjectId(playlist_id)},
-            {"$push": {"musicIds": music_data.musicId}}
+            detail="Playlist not found"
         )
-    
-    updated_playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)})
     return PlaylistResponse(
         id=str(updated_playlist['_id']),
         name=updated_playlist['name'],
@@ -182,27 +199,21 @@ async def add_music_to_playlist(
 async def remove_music_from_playlist(
     playlist_id: str,
     music_id: str,
-    user_id: str = Depends(get_current_user_id)
+    user_id: str = Depends(get_current_user_id),
+    db = Depends(get_db)
 ):
-    playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)})
-    if not playlist:
+    # Single atomic $pull with ownership in the filter
+    updated_playlist = await db.playlists.find_one_and_update(
+        {"_id": ObjectId(playlist_id), "userId": user_id},
+        {"$pull": {"musicIds": music_id}},
+        return_document=ReturnDocument.AFTER,
+        projection=_PLAYLIST_PROJECTION
+    )
+    if not updated_playlist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Playlist not found"
         )
-    
-    if playlist['userId'] != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to modify this playlist"
-        )
-    
-    await db.playlists.update_one(
-        {"_id": ObjectId(playlist_id)},
-        {"$pull": {"musicIds": music_id}}
-    )
-    
-    updated_playlist = await db.playlists.find_one({"_id": ObjectId(playlist_id)})
     return PlaylistResponse(
         id=str(updated_playlist['_id']),
         name=updated_playlist['name'],
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Migração idempotente de coleções e índices do MusicStream.
+
+Rodada uma vez por release pelo pipeline de deploy, em vez de cada
+worker repetir os round-trips de createIndexes no boot: cria as
+coleções, aplica o diff declarado em utils.database_utils (incluindo a
+remoção de índices obsoletos e o Atlas Search quando disponível) e
+grava o documento-sentinela em db['_schema'] que libera o boot dos
+workers de qualquer trabalho de schema.
+
+Uso:
+    python scripts/migrate_indexes.py
+
+Variáveis de ambiente: MONGO_URL (ou MONGO_LOCAL_URL) e DB_NAME,
+as mesmas do servidor.
+"""
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Permite rodar o script de qualquer diretório
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from utils.database_utils import (
+    COLLECTIONS,
+    SCHEMA_VERSION,
+    _ensure_indexes,
+    create_collections,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("migrate_indexes")
+
+async def migrate() -> bool:
+    """Aplica o schema e grava o sentinela; False em caso de falha"""
+    mongo_url = os.getenv("MONGO_URL") or os.getenv("MONGO_LOCAL_URL", "mongodb://localhost:27017")
+    db_name = os.getenv("DB_NAME", "musicstream")
+
+    client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=10000)
+    db = client[db_name]
+    try:
+        await create_collections(db)
+        await asyncio.gather(*[_ensure_indexes(db, name) for name in COLLECTIONS])
+        await db['_schema'].replace_one(
+            {'_id': SCHEMA_VERSION},
+            {'_id': SCHEMA_VERSION, 'appliedAt': datetime.utcnow()},
+            upsert=True
+        )
+        logger.info("Migracao concluida; sentinela '%s' gravado em '%s'", SCHEMA_VERSION, db_name)
+        return True
+    except Exception as e:
+        logger.error("Migracao falhou: %s", e)
+        return False
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(migrate()) else 1)
@@ -41,9 +41,12 @@ def main():
             host=config["host"],
             port=config["port"],
             log_level="info",
-            access_log=True,
+            access_log=False,  # Synchronous access log costs per request
             # Render-specific optimizations
-            workers=1,  # Single worker for free tier
+            workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+            limit_concurrency=1000,  # Shed load before latency collapses
+            timeout_keep_alive=30,
+            backlog=2048,
             loop="uvloop",  # Faster event loop if available
             http="httptools",  # Faster HTTP parser if available
             reload=False  # Never reload in production
@@ -6,12 +6,26 @@ import requests
 import time
 import json
 from datetime import datetime
+from urllib3.util import Retry
 
 class RenderMonitor:
     def __init__(self, base_url="https://music-project-back-4.onrender.com"):
         self.base_url = base_url
         self.session = requests.Session()
         self.session.timeout = 10
+        # Reusar o socket TLS entre os checks — o handshake com o Render
+        # (~100-300ms) só é pago uma vez no loop inteiro de monitoramento
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=4,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Connection": "keep-alive",
+            "User-Agent": "render-monitor/1"
+        })
         
     def check_health(self):
         """Verifica saúde da API"""
@@ -1,80 +1,405 @@
 """
 Utilitários para gerenciamento do banco de dados MongoDB
 """
+import asyncio
 import logging
+import os
+import time
+from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import CollectionInvalid
 
 logger = logging.getLogger(__name__)
 
+class CircuitBreaker:
+    """
+    Disjuntor simples para o caminho de conexão com o banco.
+
+    Após max_failures falhas consecutivas, novas tentativas falham
+    imediatamente por reset_after segundos em vez de bloquear pelo
+    serverSelectionTimeoutMS inteiro a cada reconexão.
+    """
+
+    def __init__(self, max_failures: int = 5, reset_after: float = 10.0):
+        self.max_failures = max_failures
+        self.reset_after = reset_after
+        self.fail_count = 0
+        self.opened_at = 0.0
+
+    def is_open(self) -> bool:
+        """Retorna True enquanto novas tentativas devem falhar rápido"""
+        if self.fail_count < self.max_failures:
+            return False
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            # Janela expirou — libera uma tentativa (estado half-open)
+            self.fail_count = self.max_failures - 1
+            return False
+        return True
+
+    def record_failure(self):
+        """Registra uma falha e abre o disjuntor ao atingir o limite"""
+        self.fail_count += 1
+        if self.fail_count >= self.max_failures:
+            self.opened_at = time.monotonic()
+
+    def reset(self):
+        """Fecha o disjuntor após uma conexão bem-sucedida"""
+        self.fail_count = 0
+        self.opened_at = 0.0
+
+# Coleções que a aplicação usa, em uma tabela só
+COLLECTIONS = ('users', 'musics', 'playlists')
+
+# Recorte opcional do índice createdAt de musics (ex: "2024-01-01").
+# Definido, o índice vira parcial e só cobre documentos a partir da
+# data, encolhendo o working set em RAM. Atenção: índice parcial só
+# atende consultas que incluam o mesmo filtro $gte — habilite apenas
+# quando as listagens passarem a recortar por data
+MUSICS_CREATEDAT_CUTOFF = os.environ.get('MUSICS_CREATEDAT_INDEX_CUTOFF', '')
+
+def _parse_createdat_cutoff():
+    """Valida o recorte configurado; valor inválido desativa o parcial
+    com um aviso em vez de derrubar o processo no import"""
+    if not MUSICS_CREATEDAT_CUTOFF:
+        return None
+    try:
+        return datetime.fromisoformat(MUSICS_CREATEDAT_CUTOFF)
+    except ValueError:
+        logger.warning(
+            "MUSICS_CREATEDAT_INDEX_CUTOFF invalido (%r); mantendo o indice createdAt cheio",
+            MUSICS_CREATEDAT_CUTOFF
+        )
+        return None
+
+_CREATEDAT_CUTOFF = _parse_createdat_cutoff()
+
+def _musics_createdat_options() -> dict:
+    """Opções do índice createdAt de musics, conforme o recorte configurado"""
+    if _CREATEDAT_CUTOFF is None:
+        return {"name": "createdAt_-1"}
+    return {
+        "name": "createdAt_recent",
+        "partialFilterExpression": {"createdAt": {"$gte": _CREATEDAT_CUTOFF}},
+    }
+
+# Especificação declarativa dos índices: coleção -> [(chaves, opções)].
+# Cada entrada precisa de um "name" estável para o diff com list_indexes
+INDEX_SPEC = {
+    "users": [
+        # Parcial: só indexa documentos com email string (contas
+        # OAuth-only sem email ficam fora da B-tree)
+        ("email", {
+            "unique": True,
+            "partialFilterExpression": {"email": {"$type": "string"}},
+            "name": "email_unique",
+        }),
+    ],
+    "musics": [
+        ([("title", "text"), ("artist", "text"), ("genre", "text")],
+         {"name": "title_text_artist_text_genre_text"}),
+        # Compound cobre "meus uploads, mais recentes primeiro" com um
+        # índice só (filtro + ordenação)
+        ([("uploadedBy", 1), ("createdAt", -1)], {"name": "uploadedBy_1_createdAt_-1"}),
+        ([("createdAt", -1)], _musics_createdat_options()),
+        ([("genre", 1), ("artist", 1)], {"name": "genre_1_artist_1"}),
+    ],
+    "playlists": [
+        # Consultas de playlist filtram por userId e ordenam por data
+        ([("userId", 1), ("createdAt", -1)], {"name": "userId_1_createdAt_-1"}),
+    ],
+}
+
+# Singletons substituídos pelos compostos acima; removidos no upgrade.
+# A variante de createdAt que não está em uso também é descartada para
+# não manter o índice cheio e o parcial lado a lado
+OBSOLETE_INDEXES = {
+    "users": ("email_1",),
+    "musics": (
+        "uploadedBy_1",
+        "createdAt_1",
+        "createdAt_-1" if _CREATEDAT_CUTOFF else "createdAt_recent",
+    ),
+    "playlists": ("userId_1", "createdAt_1"),
+}
+
+_TEXT_INDEX_NAME = "title_text_artist_text_genre_text"
+
+# Versão do schema aplicada por scripts/migrate_indexes.py; o sentinela
+# em db['_schema'] libera o boot dos workers de qualquer RTT de índice
+SCHEMA_VERSION = "v1"
+
+# Índice Atlas Search para busca de músicas — índice invertido no mongot
+# em vez do scoring por documento do índice text clássico
+SEARCH_INDEX_DEF = {
+    "name": "default",
+    "definition": {
+        "mappings": {
+            "dynamic": False,
+            "fields": {
+                "title": {"type": "string", "analyzer": "lucene.standard"},
+                "artist": {"type": "string", "analyzer": "lucene.standard"},
+                "genre": {"type": "string", "analyzer": "lucene.standard"},
+            }
+        }
+    },
+}
+
+async def _ensure_search_index(db: AsyncIOMotorDatabase) -> bool:
+    """Tenta criar o índice Atlas Search; False em servidores sem mongot"""
+    try:
+        await db.command({
+            "createSearchIndexes": "musics",
+            "indexes": [SEARCH_INDEX_DEF]
+        })
+        logger.info("Indice Atlas Search criado para musicas")
+        return True
+    except Exception as e:
+        logger.debug("Atlas Search indisponivel (%s); mantendo indice text", e)
+        return False
+
+# Bancos já inicializados neste processo — reconexões (ex: /api/db-test)
+# não precisam repetir list_collection_names nem o diff de índices
+_initialized: set = set()
+
+# Coleções com índices já garantidos neste processo (lazy, na primeira
+# escrita); o lock evita dois diffs concorrentes da mesma coleção
+_ready: set = set()
+_ready_lock = asyncio.Lock()
+
+# Snapshot do catálogo carregado no boot; cada entrada é consumida uma
+# única vez pelo diff de índices para não usar dados velhos
+_catalog_indexes: dict = {}
+
+# Handles de coleção cacheados — db[name] constrói um wrapper Motor novo
+# a cada acesso, e esses handles são imutáveis e reutilizáveis
+_collections: dict = {}
+
+def _coll(db: AsyncIOMotorDatabase, name: str):
+    """Devolve o handle (cacheado) da coleção"""
+    key = (db.name, name)
+    coll = _collections.get(key)
+    if coll is None:
+        coll = _collections[key] = db[name]
+    return coll
+
+async def _load_catalog(db: AsyncIOMotorDatabase):
+    """
+    Coleções e seus índices em um único round-trip via $listCatalog
+    (MongoDB 6+); retorna None em servidores sem o estágio.
+    """
+    try:
+        rows = await db.aggregate([{"$listCatalog": {}}]).to_list(None)
+    except Exception as e:
+        logger.debug("$listCatalog indisponivel (%s)", e)
+        return None
+
+    catalog = {}
+    for row in rows:
+        indexes = row.get("md", {}).get("indexes", [])
+        catalog[row["name"]] = {
+            index.get("spec", index).get("name") for index in indexes
+        }
+    return catalog
+
+def _key_document(keys) -> dict:
+    """Converte as chaves do spec (str ou lista de pares) no documento
+    de chaves esperado pelo comando createIndexes"""
+    if isinstance(keys, str):
+        return {keys: 1}
+    return dict(keys)
+
+async def _diff_indexes(db: AsyncIOMotorDatabase, collection: str):
+    """Compara o spec com list_indexes: retorna (faltando, obsoletos)"""
+    # O snapshot do boot poupa o list_indexes da primeira escrita
+    existing = _catalog_indexes.pop(collection, None)
+    if existing is None:
+        existing = {index["name"] async for index in _coll(db, collection).list_indexes()}
+    missing = [
+        (keys, options)
+        for keys, options in INDEX_SPEC[collection]
+        if options["name"] not in existing
+    ]
+    obsolete = [
+        name for name in OBSOLETE_INDEXES.get(collection, ())
+        if name in existing
+    ]
+    return missing, obsolete
+
+async def _with_timeout(make_coro, seconds: float = 30.0, retries: int = 2):
+    """
+    Executa make_coro() sob asyncio.wait_for, com retentativas e backoff.
+
+    Recebe uma fábrica (e não a corrotina) porque o wait_for cancela a
+    corrotina ao estourar o tempo — cada tentativa precisa de uma nova.
+    Um build de índice lento assim não segura a primeira escrita para
+    sempre: esgotadas as tentativas, o TimeoutError sobe e é logado.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await asyncio.wait_for(make_coro(), seconds)
+        except asyncio.TimeoutError:
+            if attempt == retries:
+                raise
+            seconds *= 2
+            logger.warning(
+                "Operacao de indice excedeu o tempo; repetindo com limite de %.0fs",
+                seconds
+            )
+
+async def _ensure_indexes(db: AsyncIOMotorDatabase, collection: str):
+    """Aplica o diff de índices de uma coleção (cria faltantes, remove obsoletos)"""
+    missing, obsolete = await _diff_indexes(db, collection)
+
+    # Para músicas, preferir o Atlas Search ao índice text clássico; só
+    # criamos o text como fallback quando não há mongot (local/CI)
+    if any(options["name"] == _TEXT_INDEX_NAME for _, options in missing):
+        if await _ensure_search_index(db):
+            missing = [
+                (keys, options) for keys, options in missing
+                if options["name"] != _TEXT_INDEX_NAME
+            ]
+
+    tasks = []
+    if missing:
+        # Um createIndexes só com a lista inteira: N índices faltando
+        # custam 1 RTT em vez de um create_index por índice
+        indexes = [
+            {"key": _key_document(keys), "background": True, **options}
+            for keys, options in missing
+        ]
+        tasks.append(_with_timeout(
+            lambda: db.command({"createIndexes": collection, "indexes": indexes})
+        ))
+    tasks.extend(
+        _with_timeout(lambda name=name: _coll(db, collection).drop_index(name))
+        for name in obsolete
+    )
+    if not tasks:
+        return
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error("Erro ao ajustar indice de '%s': %s", collection, result)
+    logger.info(
+        "%d indice(s) criado(s), %d removido(s) em '%s'",
+        len(missing), len(obsolete), collection
+    )
+
+async def get_collection(db: AsyncIOMotorDatabase, name: str):
+    """
+    Devolve a coleção garantindo os índices na primeira escrita.
+
+    Cada worker só paga o diff/criação das coleções em que realmente
+    escreve, em vez de todas no boot.
+    """
+    if name not in _ready:
+        async with _ready_lock:
+            if name not in _ready:
+                await _ensure_indexes(db, name)
+                _ready.add(name)
+    return _coll(db, name)
+
+async def create_collections(db: AsyncIOMotorDatabase):
+    """
+    Cria todas as coleções da aplicação em paralelo, sem pre-check: o
+    próprio create_collection falha com CollectionInvalid quando a
+    coleção já existe, o que elimina um round-trip e a corrida TOCTOU
+    entre workers que listavam e criavam em seguida.
+    """
+    results = await asyncio.gather(
+        *[db.create_collection(name) for name in COLLECTIONS],
+        return_exceptions=True
+    )
+    for name, result in zip(COLLECTIONS, results):
+        if isinstance(result, CollectionInvalid):
+            continue
+        if isinstance(result, Exception):
+            raise result
+        logger.debug("Colecao '%s' criada", name)
+
 async def init_collections(db: AsyncIOMotorDatabase):
     """
     Inicializa as coleções necessárias com índices apropriados
     """
+    if db.name in _initialized:
+        return True
+
     try:
-        # Lista das coleções necessárias
-        required_collections = ['users', 'musics', 'playlists']
-        
-        # Verificar coleções existentes
-        existing_collections = await db.list_collection_names()
-        logger.info(f"📚 Coleções existentes: {existing_collections}")
-        
-        # Criar índices para coleção de usuários
-        if 'users' not in existing_collections:
-            await db.create_collection('users')
-            logger.info("✅ Coleção 'users' criada")
-        
-        # Índice único para email
-        await db.users.create_index("email", unique=True)
-        logger.info("✅ Índice único criado para email")
-        
-        # Criar índices para coleção de músicas
-        if 'musics' not in existing_collections:
-            await db.create_collection('musics')
-            logger.info("✅ Coleção 'musics' criada")
-        
-        # Índices para busca de músicas
-        await db.musics.create_index([
-            ("title", "text"), 
-            ("artist", "text"), 
-            ("genre", "text")
-        ])
-        await db.musics.create_index("uploadedBy")
-        await db.musics.create_index("createdAt")
-        logger.info("✅ Índices criados para músicas")
-        
-        # Criar índices para coleção de playlists
-        if 'playlists' not in existing_collections:
-            await db.create_collection('playlists')
-            logger.info("✅ Coleção 'playlists' criada")
-        
-        await db.playlists.create_index("userId")
-        await db.playlists.create_index("createdAt")
-        logger.info("✅ Índices criados para playlists")
-        
-        logger.info("🎉 Database inicializado com sucesso!")
+        # Com o schema migrado (scripts/migrate_indexes.py grava o
+        # sentinela), o boot custa um find_one e nenhum trabalho de
+        # coleção ou índice — por worker e por release
+        sentinel = await db['_schema'].find_one({'_id': SCHEMA_VERSION})
+        if sentinel is not None:
+            _ready.update(COLLECTIONS)
+            _initialized.add(db.name)
+            logger.info("Schema '%s' ja aplicado pela migracao", SCHEMA_VERSION)
+            return True
+
+        logger.warning(
+            "Sentinela de schema ausente — rode scripts/migrate_indexes.py; "
+            "seguindo com criacao preguicosa de indices"
+        )
+
+        # $listCatalog (quando disponível) alimenta o cache de índices em
+        # um round-trip; a criação de coleções abaixo não depende dele
+        catalog = await _load_catalog(db)
+        if catalog is not None:
+            _catalog_indexes.update(catalog)
+
+        await create_collections(db)
+
+        # Índices ficam a cargo de get_collection na primeira escrita de
+        # cada coleção — o boot não paga nenhum diff/build de índice
+
+        _initialized.add(db.name)
+        logger.info("Database inicializado com sucesso")
         return True
-        
+
     except Exception as e:
-        logger.error(f"❌ Erro ao inicializar coleções: {e}")
+        logger.error("Erro ao inicializar colecoes: %s", e)
         return False
 
 async def check_database_health(db: AsyncIOMotorDatabase) -> dict:
     """
     Verifica a saúde do banco de dados
     """
+    collections = COLLECTIONS
     try:
-        # Contar documentos em cada coleção
+        # Uma única agregação $collStats/$unionWith devolve as contagens
+        # das três coleções em um só round-trip, direto dos metadados
+        pipeline = [
+            {'$collStats': {'count': {}}},
+            {'$project': {'_id': collections[0], 'count': '$count'}},
+        ]
+        for collection_name in collections[1:]:
+            pipeline.append({'$unionWith': {'coll': collection_name, 'pipeline': [
+                {'$collStats': {'count': {}}},
+                {'$project': {'_id': collection_name, 'count': '$count'}},
+            ]}})
+
+        # Um passe só: acumula o total enquanto monta o dicionário, em
+        # vez de somar os valores numa segunda iteração
         collections_info = {}
-        
-        collections = ['users', 'musics', 'playlists']
-        for collection_name in collections:
-            count = await db[collection_name].count_documents({})
-            collections_info[collection_name] = count
-        
+        total_documents = 0
+        try:
+            rows = await _coll(db, collections[0]).aggregate(pipeline).to_list(len(collections))
+            for row in rows:
+                collections_info[row['_id']] = row['count']
+                total_documents += row['count']
+        except Exception:
+            # Fallback para servidores sem $collStats em $unionWith:
+            # contagens aproximadas em paralelo
+            counts = await asyncio.gather(
+                *[_coll(db, collection_name).estimated_document_count() for collection_name in collections]
+            )
+            for collection_name, count in zip(collections, counts):
+                collections_info[collection_name] = count
+                total_documents += count
+
         return {
             "status": "healthy",
             "collections": collections_info,
-            "total_documents": sum(collections_info.values())
+            "total_documents": total_documents
         }
         
     except Exception as e: